@@ -1,7 +1,9 @@
 import sys
 import random
 import pygame
-from typing import List, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
 
 # ---------------------------
 # Config
@@ -18,6 +20,7 @@ HIGHLIGHT_SELECT = (246, 246, 105)
 HIGHLIGHT_CHECK = (255, 80, 80)
 TEXT_COLOR = (30, 30, 30)
 OVERLAY_BG = (0, 0, 0, 180)
+PICKER_BG = (90, 90, 90)
 
 # Unicode chess symbols
 UNICODE_WHITE = {
@@ -30,16 +33,81 @@ UNICODE_BLACK = {
 # ---------------------------
 # Data Structures
 # ---------------------------
-class Piece:
-    def __init__(self, kind: str, color: str):
-        self.kind = kind  # 'P', 'R', 'N', 'B', 'Q', 'K'
-        self.color = color  # 'w' or 'b'
-
-    def __repr__(self):
-        return f"{self.color}{self.kind}"
-
-Board = List[List[Optional[Piece]]]
-Move = Tuple[int, int, int, int, Optional[str]]  # (r1, c1, r2, c2, promotion)
+# Squares are indexed 0..63 as r * 8 + c, matching screen rows/cols:
+# square 0 is a8 (top-left), square 63 is h1 (bottom-right).
+# A bitboard is an int with bit sq set per occupied square; set bits are
+# walked as: lsb = bb & -bb; sq = lsb.bit_length() - 1; bb ^= lsb.
+# Pieces are identified by a 2-char code: color ('w'/'b') + kind ('P', 'N', 'B', 'R', 'Q', 'K').
+PIECE_CODES = ('wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK')
+
+# Zobrist keys: a position's hash is the XOR of ZOB_PIECE[code][sq] over its
+# pieces, so make_move can update it in O(1). Side to move is not part of a
+# Position; callers that care key on (hash, color).
+_zobrist_rng = random.Random(0x5EED)
+ZOB_PIECE = {code: [_zobrist_rng.getrandbits(64) for _ in range(64)] for code in PIECE_CODES}
+
+
+# slots=True drops the per-instance __dict__ (Python 3.10+)
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_DATACLASS_SLOTS)
+class Position:
+    # One bitboard per piece type per color
+    wP: int = 0
+    wN: int = 0
+    wB: int = 0
+    wR: int = 0
+    wQ: int = 0
+    wK: int = 0
+    bP: int = 0
+    bN: int = 0
+    bB: int = 0
+    bR: int = 0
+    bQ: int = 0
+    bK: int = 0
+    # Cached occupancy and Zobrist hash, kept in sync via refresh()
+    white: int = 0
+    black: int = 0
+    occ: int = 0
+    hash: int = 0
+
+    def refresh(self):
+        self.white = self.wP | self.wN | self.wB | self.wR | self.wQ | self.wK
+        self.black = self.bP | self.bN | self.bB | self.bR | self.bQ | self.bK
+        self.occ = self.white | self.black
+        h = 0
+        for code in PIECE_CODES:
+            keys = ZOB_PIECE[code]
+            bb = getattr(self, code)
+            while bb:
+                lsb = bb & -bb
+                h ^= keys[lsb.bit_length() - 1]
+                bb ^= lsb
+        self.hash = h
+
+
+# Moves are packed ints: from | (to << 6) | (promo << 12), promo indexing PROMO_KINDS
+Move = int
+PROMO_KINDS = (None, 'N', 'B', 'R', 'Q')
+PROMO_QUEEN = 4
+PROMO_CHOICES = (4, 3, 2, 1)  # Q, R, B, N: order shown in the promotion picker
+
+
+def encode(from_sq: int, to_sq: int, promo: int = 0) -> Move:
+    return from_sq | (to_sq << 6) | (promo << 12)
+
+
+def mv_from(move: Move) -> int:
+    return move & 63
+
+
+def mv_to(move: Move) -> int:
+    return (move >> 6) & 63
+
+
+def mv_promo(move: Move) -> int:
+    return move >> 12
 
 
 # ---------------------------
@@ -75,324 +143,600 @@ UI_FONT = pygame.font.SysFont("Segoe UI", 24) or pygame.font.Font(None, 24)
 BIG_UI_FONT = pygame.font.SysFont("Segoe UI", 40) or pygame.font.Font(None, 40)
 
 
+def render_piece_surfaces() -> Dict[str, Tuple[pygame.Surface, pygame.Surface]]:
+    # (glyph, shadow) per piece code, rendered once; pieces missing here use the shape fallback
+    surfaces: Dict[str, Tuple[pygame.Surface, pygame.Surface]] = {}
+    for color, glyph_map in (('w', UNICODE_WHITE), ('b', UNICODE_BLACK)):
+        for kind, glyph in glyph_map.items():
+            try:
+                surf = PIECE_FONT.render(glyph, True, (0, 0, 0)).convert_alpha()
+                # Simple shadow
+                shadow = PIECE_FONT.render(glyph, True, (255, 255, 255)).convert_alpha()
+            except Exception:
+                continue
+            surfaces[color + kind] = (surf, shadow)
+    return surfaces
+
+
+PIECE_SURFACES = render_piece_surfaces()
+
+
 # ---------------------------
 # Board Setup
 # ---------------------------
 
-def initial_board() -> Board:
-    board: Board = [[None for _ in range(COLS)] for _ in range(ROWS)]
-    # Place pieces
-    placement = ['R', 'N', 'B', 'Q', 'K', 'B', 'N', 'R']
-    # White back rank (row 7), pawns row 6
-    for c, k in enumerate(placement):
-        board[7][c] = Piece(k, 'w')
-    for c in range(COLS):
-        board[6][c] = Piece('P', 'w')
-    # Black back rank (row 0), pawns row 1
-    for c, k in enumerate(placement):
-        board[0][c] = Piece(k, 'b')
-    for c in range(COLS):
-        board[1][c] = Piece('P', 'b')
-    return board
+def initial_board() -> Position:
+    pos = Position(
+        # Black back rank (row 0), pawns row 1
+        bR=0x0000000000000081, bN=0x0000000000000042, bB=0x0000000000000024,
+        bQ=0x0000000000000008, bK=0x0000000000000010, bP=0x000000000000FF00,
+        # White back rank (row 7), pawns row 6
+        wR=0x8100000000000000, wN=0x4200000000000000, wB=0x2400000000000000,
+        wQ=0x0800000000000000, wK=0x1000000000000000, wP=0x00FF000000000000,
+    )
+    pos.refresh()
+    return pos
 
 
 # ---------------------------
 # Helpers
 # ---------------------------
 
-def in_bounds(r: int, c: int) -> bool:
-    return 0 <= r < ROWS and 0 <= c < COLS
+def piece_at(pos: Position, sq: int) -> Optional[str]:
+    if not (pos.occ >> sq) & 1:
+        return None
+    for code in PIECE_CODES:
+        if (getattr(pos, code) >> sq) & 1:
+            return code
+    return None
 
 
-def find_king(board: Board, color: str) -> Tuple[int, int]:
-    for r in range(ROWS):
-        for c in range(COLS):
-            piece = board[r][c]
-            if piece and piece.kind == 'K' and piece.color == color:
-                return (r, c)
-    return (-1, -1)
+def color_occ(pos: Position, color: str) -> int:
+    return pos.white if color == 'w' else pos.black
 
 
-def clone_board(board: Board) -> Board:
-    newb: Board = [[None for _ in range(COLS)] for _ in range(ROWS)]
-    for r in range(ROWS):
-        for c in range(COLS):
-            p = board[r][c]
-            if p:
-                newb[r][c] = Piece(p.kind, p.color)
-    return newb
+def find_king(pos: Position, color: str) -> int:
+    kings = pos.wK if color == 'w' else pos.bK
+    return kings.bit_length() - 1
 
 
 # ---------------------------
-# Move Generation (Pseudo-legal)
+# Attack Tables
 # ---------------------------
-
-def pawn_moves(board: Board, r: int, c: int, color: str) -> List[Move]:
-    moves: List[Move] = []
-    dir = -1 if color == 'w' else 1
-    start_row = 6 if color == 'w' else 1
-    promotion_row = 0 if color == 'w' else 7
-
-    # Forward 1
-    r1, c1 = r + dir, c
-    if in_bounds(r1, c1) and board[r1][c1] is None:
-        if r1 == promotion_row:
-            moves.append((r, c, r1, c1, 'Q'))
-        else:
-            moves.append((r, c, r1, c1, None))
-        # Forward 2 from start
-        r2 = r + 2 * dir
-        if r == start_row and board[r2][c1] is None:
-            moves.append((r, c, r2, c1, None))
-
-    # Captures
-    for dc in (-1, 1):
-        rr, cc = r + dir, c + dc
-        if in_bounds(rr, cc) and board[rr][cc] is not None and board[rr][cc].color != color:
-            if rr == promotion_row:
-                moves.append((r, c, rr, cc, 'Q'))
-            else:
-                moves.append((r, c, rr, cc, None))
-
-    # No en passant for simplicity
-    return moves
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:  # Python < 3.10
+    def popcount(b: int) -> int:
+        return bin(b).count('1')
+
+
+FULL_BB = 0xFFFFFFFFFFFFFFFF
+NOT_A_FILE = 0xFEFEFEFEFEFEFEFE
+NOT_H_FILE = 0x7F7F7F7F7F7F7F7F
+NOT_AB_FILE = 0xFCFCFCFCFCFCFCFC
+NOT_GH_FILE = 0x3F3F3F3F3F3F3F3F
+RANK_8 = 0xFF          # row 0
+RANK_6 = 0xFF << 16
+RANK_3 = 0xFF << 40
+RANK_1 = 0xFF << 56    # row 7
+
+
+def _knight_attacks(b: int) -> int:
+    return (((b << 17) & NOT_A_FILE) | ((b << 15) & NOT_H_FILE)
+            | ((b << 10) & NOT_AB_FILE) | ((b << 6) & NOT_GH_FILE)
+            | ((b >> 17) & NOT_H_FILE) | ((b >> 15) & NOT_A_FILE)
+            | ((b >> 10) & NOT_GH_FILE) | ((b >> 6) & NOT_AB_FILE)) & FULL_BB
+
+
+def _king_attacks(b: int) -> int:
+    sides = ((b << 1) & NOT_A_FILE) | ((b >> 1) & NOT_H_FILE)
+    row = b | sides
+    return (sides | (row << 8) | (row >> 8)) & FULL_BB
+
+
+def _pawn_attackers(b: int, color: str) -> int:
+    # Squares from which a color pawn attacks b: one step diagonally backward
+    if color == 'w':
+        return (((b << 7) & NOT_H_FILE) | ((b << 9) & NOT_A_FILE)) & FULL_BB
+    return ((b >> 9) & NOT_H_FILE) | ((b >> 7) & NOT_A_FILE)
+
+
+KNIGHT_ATTACKS = [_knight_attacks(1 << sq) for sq in range(64)]
+KING_ATTACKS = [_king_attacks(1 << sq) for sq in range(64)]
+PAWN_ATTACKERS = {color: [_pawn_attackers(1 << sq, color) for sq in range(64)] for color in ('w', 'b')}
+
+
+# Sliding attacks via magic bitboards: the blockers on a slider's relevant
+# rays are hashed by (blockers * magic) >> shift into a per-square table.
+# The magics were found offline for this square numbering (a8 = 0); a
+# startup search in pure Python takes tens of seconds.
+ROOK_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+ROOK_MAGICS = [
+    0x108001108CC00020, 0x0240400020001000, 0x0880200009801000, 0x8880100082080004,
+    0x0080080004008002, 0x1200040801020010, 0xA480010000801200, 0x0100003041000082,
+    0x1410800090400020, 0x0004404000201000, 0x8000802000801000, 0x011A808010000800,
+    0x0441000411000801, 0x0C05000400122900, 0x0019002100120084, 0x0002001089440205,
+    0x2008348000400080, 0x8150014020004000, 0x8030002004002800, 0x0820090010002500,
+    0x1402020010200408, 0x2020080104402010, 0x0902040041100832, 0x0408020001208044,
+    0x20A4802080084010, 0x0408420200210090, 0x0000401100200105, 0x0000100080080080,
+    0x0120040080080080, 0x0022000280240080, 0x1389100402080200, 0x0180005200040091,
+    0x6440008040800024, 0x0400220102004088, 0x4410812001807000, 0x0040801000800800,
+    0x400A000412002008, 0x0800020080800400, 0x8008100204000108, 0x202010A042000411,
+    0x0900804000208000, 0x4450004020064000, 0x0009001020010040, 0xAB8221001003000A,
+    0x0001008802050010, 0x0906001008020004, 0xA029003200110004, 0x8020408100420004,
+    0x0012400480092080, 0x2020008020400080, 0x0000841000200880, 0x0040800800100480,
+    0x0408800402080080, 0x0040040080020080, 0x00A0104102080400, 0x0408130046840200,
+    0x0200110820408005, 0x0002400082241105, 0x0800402000100901, 0x0000200A000C4006,
+    0x0001009004280007, 0x00A1000C00080203, 0x800002011801902C, 0x00880AC081041022,
+]
+BISHOP_MAGICS = [
+    0x1020880088108020, 0x0020010401105000, 0x0010088481101000, 0x82088A0200880041,
+    0x000202100002AB04, 0x0101040240401000, 0x2301011002200000, 0x8800210100A06000,
+    0x00004012021C0920, 0x05102202C8020080, 0x0022C42122021041, 0x2002082080201000,
+    0x0009840420000040, 0x1002008221208000, 0x0020220A02200601, 0x4200032208020922,
+    0x4A28411183080800, 0x0048402011090A12, 0x1010000A04820188, 0x001802488200408B,
+    0x0004020200940010, 0x094D000080600200, 0x0060878402080281, 0x08402410840C0200,
+    0x40203000E5048800, 0x0251082020820404, 0x0448080804002A20, 0x4004010200200880,
+    0x000101000A104010, 0x0100410222100201, 0x8908022000421200, 0x0014111140424201,
+    0x0004444080200280, 0x0008240244100220, 0x0004002084441100, 0x8441600800090250,
+    0x0004010400220082, 0x1021020203108800, 0xA012020040041412, 0x2804444240688410,
+    0x0141042004806080, 0x0014054C10008204, 0x1145040022000401, 0x0000012024200800,
+    0x8003142102105400, 0x6140008089028080, 0x0008128892000400, 0x088418A400400510,
+    0x80848182831A0010, 0x0040308808080410, 0x8004090080900000, 0x6244100308480008,
+    0x8800002020410008, 0x0040C20801410001, 0x002002F002209042, 0x0002220424008000,
+    0x0202010480A42000, 0x0000020042021110, 0x0104022110909004, 0x000000C4002A0800,
+    0x0002F02040082200, 0x0410000490021204, 0x401810040820A400, 0x0020020088008080,
+]
 
 
-def sliding_moves(board: Board, r: int, c: int, color: str, directions: List[Tuple[int, int]]) -> List[Move]:
-    res: List[Move] = []
+def _slider_attacks(sq: int, occ: int, directions: List[Tuple[int, int]]) -> int:
+    r, c = divmod(sq, COLS)
+    attacks = 0
     for dr, dc in directions:
         rr, cc = r + dr, c + dc
-        while in_bounds(rr, cc):
-            if board[rr][cc] is None:
-                res.append((r, c, rr, cc, None))
-            else:
-                if board[rr][cc].color != color:
-                    res.append((r, c, rr, cc, None))
+        while 0 <= rr < ROWS and 0 <= cc < COLS:
+            bit = 1 << (rr * COLS + cc)
+            attacks |= bit
+            if occ & bit:
                 break
             rr += dr
             cc += dc
-    return res
+    return attacks
 
 
-def knight_moves(board: Board, r: int, c: int, color: str) -> List[Move]:
-    res: List[Move] = []
-    for dr, dc in [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]:
+def _relevant_mask(sq: int, directions: List[Tuple[int, int]]) -> int:
+    # Ray squares whose occupancy matters, i.e. excluding the board edge
+    r, c = divmod(sq, COLS)
+    mask = 0
+    for dr, dc in directions:
         rr, cc = r + dr, c + dc
-        if in_bounds(rr, cc) and (board[rr][cc] is None or board[rr][cc].color != color):
-            res.append((r, c, rr, cc, None))
-    return res
+        while 0 <= rr + dr < ROWS and 0 <= cc + dc < COLS:
+            mask |= 1 << (rr * COLS + cc)
+            rr += dr
+            cc += dc
+    return mask
+
+
+def _build_attack_table(masks: List[int], magics: List[int], shifts: List[int],
+                        directions: List[Tuple[int, int]]) -> List[List[int]]:
+    table: List[List[int]] = []
+    for sq in range(64):
+        mask, magic, shift = masks[sq], magics[sq], shifts[sq]
+        entries = [0] * (1 << (64 - shift))
+        # Enumerate every subset of the mask (carry-rippler)
+        sub = 0
+        while True:
+            entries[((sub * magic) & FULL_BB) >> shift] = _slider_attacks(sq, sub, directions)
+            sub = (sub - mask) & mask
+            if not sub:
+                break
+        table.append(entries)
+    return table
 
 
-def king_moves(board: Board, r: int, c: int, color: str) -> List[Move]:
-    res: List[Move] = []
-    for dr in (-1, 0, 1):
-        for dc in (-1, 0, 1):
-            if dr == 0 and dc == 0:
-                continue
-            rr, cc = r + dr, c + dc
-            if in_bounds(rr, cc) and (board[rr][cc] is None or board[rr][cc].color != color):
-                res.append((r, c, rr, cc, None))
-    # Castling not implemented
-    return res
+ROOK_MASKS = [_relevant_mask(sq, ROOK_DIRECTIONS) for sq in range(64)]
+BISHOP_MASKS = [_relevant_mask(sq, BISHOP_DIRECTIONS) for sq in range(64)]
+ROOK_SHIFTS = [64 - popcount(m) for m in ROOK_MASKS]
+BISHOP_SHIFTS = [64 - popcount(m) for m in BISHOP_MASKS]
+ROOK_ATTACKS = _build_attack_table(ROOK_MASKS, ROOK_MAGICS, ROOK_SHIFTS, ROOK_DIRECTIONS)
+BISHOP_ATTACKS = _build_attack_table(BISHOP_MASKS, BISHOP_MAGICS, BISHOP_SHIFTS, BISHOP_DIRECTIONS)
 
 
-def generate_pseudo_legal(board: Board, color: str) -> List[Move]:
-    moves: List[Move] = []
-    for r in range(ROWS):
-        for c in range(COLS):
-            p = board[r][c]
-            if not p or p.color != color:
-                continue
-            if p.kind == 'P':
-                moves.extend(pawn_moves(board, r, c, color))
-            elif p.kind == 'R':
-                moves.extend(sliding_moves(board, r, c, color, [(1, 0), (-1, 0), (0, 1), (0, -1)]))
-            elif p.kind == 'B':
-                moves.extend(sliding_moves(board, r, c, color, [(1, 1), (1, -1), (-1, 1), (-1, -1)]))
-            elif p.kind == 'Q':
-                moves.extend(sliding_moves(board, r, c, color,
-                                           [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]))
-            elif p.kind == 'N':
-                moves.extend(knight_moves(board, r, c, color))
-            elif p.kind == 'K':
-                moves.extend(king_moves(board, r, c, color))
-    return moves
+def rook_attacks(sq: int, occ: int) -> int:
+    return ROOK_ATTACKS[sq][(((occ & ROOK_MASKS[sq]) * ROOK_MAGICS[sq]) & FULL_BB) >> ROOK_SHIFTS[sq]]
+
+
+def bishop_attacks(sq: int, occ: int) -> int:
+    return BISHOP_ATTACKS[sq][(((occ & BISHOP_MASKS[sq]) * BISHOP_MAGICS[sq]) & FULL_BB) >> BISHOP_SHIFTS[sq]]
+
+
+def _between(a: int, b: int) -> int:
+    # Squares strictly between a and b when they share a line, else 0
+    if rook_attacks(a, 0) >> b & 1:
+        return rook_attacks(a, 1 << b) & rook_attacks(b, 1 << a)
+    if bishop_attacks(a, 0) >> b & 1:
+        return bishop_attacks(a, 1 << b) & bishop_attacks(b, 1 << a)
+    return 0
+
+
+BETWEEN = [[_between(a, b) for b in range(64)] for a in range(64)]
 
 
 # ---------------------------
 # Check Detection and Legal Move Filtering
 # ---------------------------
 
-def apply_move(board: Board, move: Move) -> Board:
-    r1, c1, r2, c2, promo = move
-    newb = clone_board(board)
-    piece = newb[r1][c1]
-    newb[r1][c1] = None
-    if promo and piece and piece.kind == 'P':
-        newb[r2][c2] = Piece(promo, piece.color)
+def make_move(pos: Position, move: Move):
+    # Play move in place, keeping occupancy and hash in sync
+    from_sq, to = mv_from(move), mv_to(move)
+    promo = PROMO_KINDS[mv_promo(move)]
+    from_bit = 1 << from_sq
+    to_bit = 1 << to
+    moved = piece_at(pos, from_sq)
+    captured = piece_at(pos, to)
+    placed = moved[0] + promo if promo and moved[1] == 'P' else moved
+    if captured:
+        setattr(pos, captured, getattr(pos, captured) ^ to_bit)
+        pos.hash ^= ZOB_PIECE[captured][to]
+    setattr(pos, moved, getattr(pos, moved) ^ from_bit)
+    setattr(pos, placed, getattr(pos, placed) ^ to_bit)
+    pos.hash ^= ZOB_PIECE[moved][from_sq] ^ ZOB_PIECE[placed][to]
+    if moved[0] == 'w':
+        pos.white ^= from_bit | to_bit
+        if captured:
+            pos.black ^= to_bit
     else:
-        newb[r2][c2] = piece
-    return newb
-
-
-def square_attacked_by(board: Board, r: int, c: int, attacker_color: str) -> bool:
-    # Generate pseudo-legal moves for attacker and see if any reaches (r, c)
-    # Slightly optimized by checking patterns
-    # Pawns
-    dir = -1 if attacker_color == 'w' else 1
-    for dc in (-1, 1):
-        rr, cc = r - dir, c - dc  # reverse because we want squares that attack (r,c)
-        if in_bounds(rr, cc):
-            p = board[rr][cc]
-            if p and p.color == attacker_color and p.kind == 'P':
-                return True
-
-    # Knights
-    for dr, dc in [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]:
-        rr, cc = r + dr, c + dc
-        if in_bounds(rr, cc):
-            p = board[rr][cc]
-            if p and p.color == attacker_color and p.kind == 'N':
-                return True
-
-    # Kings (adjacent squares)
-    for dr in (-1, 0, 1):
-        for dc in (-1, 0, 1):
-            if dr == 0 and dc == 0:
+        pos.black ^= from_bit | to_bit
+        if captured:
+            pos.white ^= to_bit
+    pos.occ = pos.white | pos.black
+
+
+def apply_move(pos: Position, move: Move) -> Position:
+    newp = replace(pos)
+    make_move(newp, move)
+    return newp
+
+
+def square_attacked_by(pos: Position, sq: int, attacker_color: str) -> bool:
+    # Cheapest tests first: king, knight and pawn tables, then sliders
+    if (KING_ATTACKS[sq] & getattr(pos, attacker_color + 'K')
+            or KNIGHT_ATTACKS[sq] & getattr(pos, attacker_color + 'N')
+            or PAWN_ATTACKERS[attacker_color][sq] & getattr(pos, attacker_color + 'P')):
+        return True
+    queens = getattr(pos, attacker_color + 'Q')
+    return bool(rook_attacks(sq, pos.occ) & (getattr(pos, attacker_color + 'R') | queens)
+                or bishop_attacks(sq, pos.occ) & (getattr(pos, attacker_color + 'B') | queens))
+
+
+def attackers_to(pos: Position, sq: int, occ: int, attacker_color: str) -> int:
+    # All attacker_color pieces attacking sq, with sliders blocked by occ
+    queens = getattr(pos, attacker_color + 'Q')
+    return ((PAWN_ATTACKERS[attacker_color][sq] & getattr(pos, attacker_color + 'P'))
+            | (KNIGHT_ATTACKS[sq] & getattr(pos, attacker_color + 'N'))
+            | (KING_ATTACKS[sq] & getattr(pos, attacker_color + 'K'))
+            | (rook_attacks(sq, occ) & (getattr(pos, attacker_color + 'R') | queens))
+            | (bishop_attacks(sq, occ) & (getattr(pos, attacker_color + 'B') | queens)))
+
+
+def compute_checkers_and_pins(pos: Position, color: str) -> Tuple[int, Dict[int, int]]:
+    # Returns the pieces giving check to color's king, and for each pinned
+    # piece of color the ray (up to and including the pinner) it may move along
+    kings = getattr(pos, color + 'K')
+    if not kings:
+        return 0, {}
+    ksq = kings.bit_length() - 1
+    enemy = 'b' if color == 'w' else 'w'
+    checkers = attackers_to(pos, ksq, pos.occ, enemy)
+    pins: Dict[int, int] = {}
+    own = color_occ(pos, color)
+    queens = getattr(pos, enemy + 'Q')
+    snipers = ((rook_attacks(ksq, 0) & (getattr(pos, enemy + 'R') | queens))
+               | (bishop_attacks(ksq, 0) & (getattr(pos, enemy + 'B') | queens)))
+    while snipers:
+        lsb = snipers & -snipers
+        s = lsb.bit_length() - 1
+        snipers ^= lsb
+        blockers = BETWEEN[ksq][s] & pos.occ
+        # Exactly one blocker, and it is ours
+        if blockers and not blockers & (blockers - 1) and blockers & own:
+            pins[blockers.bit_length() - 1] = BETWEEN[ksq][s] | (1 << s)
+    return checkers, pins
+
+
+def is_in_check(pos: Position, color: str) -> bool:
+    ksq = find_king(pos, color)
+    if ksq == -1:
+        return False
+    opponent = 'b' if color == 'w' else 'w'
+    return square_attacked_by(pos, ksq, opponent)
+
+
+def legal_move_batches(pos: Position, color: str, include_underpromotions: bool = False) -> Iterator[List[Move]]:
+    # Yields legal moves one piece class at a time, cheapest first (king,
+    # pawns, knights, bishops, rooks), so callers can stop at the first one.
+    # Promotions are queen-only unless include_underpromotions is set.
+    kings = getattr(pos, color + 'K')
+    if not kings:
+        return
+    ksq = kings.bit_length() - 1
+    enemy = 'b' if color == 'w' else 'w'
+    checkers, pins = compute_checkers_and_pins(pos, color)
+
+    # King: target squares must be safe with the king lifted off its square,
+    # so sliders checking along the king's line see through it
+    batch: List[Move] = []
+    occ_without_king = pos.occ ^ kings
+    targets = KING_ATTACKS[ksq] & ~color_occ(pos, color)
+    while targets:
+        lsb = targets & -targets
+        to = lsb.bit_length() - 1
+        targets ^= lsb
+        if not attackers_to(pos, to, occ_without_king, enemy):
+            batch.append(ksq | (to << 6))
+    yield batch
+
+    # Double check: only the king may move
+    if checkers & (checkers - 1):
+        return
+    # Single check: other pieces must capture the checker or block its ray
+    if checkers:
+        evasion = checkers | BETWEEN[ksq][checkers.bit_length() - 1]
+    else:
+        evasion = FULL_BB
+
+    # Pawns: every push and capture at once, one shift per direction. Each
+    # target set maps back to its pawns by a fixed square offset; pinned
+    # pawns are checked per move against their pin ray. No en passant.
+    batch = []
+    pawns = getattr(pos, color + 'P')
+    empty = ~pos.occ & FULL_BB
+    them = color_occ(pos, enemy)
+    if color == 'w':
+        single = (pawns >> 8) & empty
+        pawn_targets = ((single, 8), (((single & RANK_3) >> 8) & empty, 16),
+                        ((pawns >> 9) & NOT_H_FILE & them, 9), ((pawns >> 7) & NOT_A_FILE & them, 7))
+        promotion_rank = RANK_8
+    else:
+        single = (pawns << 8) & empty
+        pawn_targets = ((single, -8), (((single & RANK_6) << 8) & empty, -16),
+                        ((pawns << 7) & NOT_H_FILE & them, -7), ((pawns << 9) & NOT_A_FILE & them, -9))
+        promotion_rank = RANK_1
+    promos = PROMO_CHOICES if include_underpromotions else (PROMO_QUEEN,)
+    for targets, offset in pawn_targets:
+        targets &= evasion
+        while targets:
+            lsb = targets & -targets
+            to = lsb.bit_length() - 1
+            targets ^= lsb
+            sq = to + offset
+            if sq in pins and not (pins[sq] >> to) & 1:
                 continue
-            rr, cc = r + dr, c + dc
-            if in_bounds(rr, cc):
-                p = board[rr][cc]
-                if p and p.color == attacker_color and p.kind == 'K':
-                    return True
-
-    # Sliding pieces: rooks/queens (orthogonal), bishops/queens (diagonal)
-    # Orthogonal
-    for dr, dc in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-        rr, cc = r + dr, c + dc
-        while in_bounds(rr, cc):
-            p = board[rr][cc]
-            if p:
-                if p.color == attacker_color and (p.kind == 'R' or p.kind == 'Q'):
-                    return True
-                break
-            rr += dr
-            cc += dc
-    # Diagonal
-    for dr, dc in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
-        rr, cc = r + dr, c + dc
-        while in_bounds(rr, cc):
-            p = board[rr][cc]
-            if p:
-                if p.color == attacker_color and (p.kind == 'B' or p.kind == 'Q'):
-                    return True
-                break
-            rr += dr
-            cc += dc
+            if lsb & promotion_rank:
+                batch.extend(encode(sq, to, p) for p in promos)
+            else:
+                batch.append(sq | (to << 6))
+    yield batch
+
+    # Pieces: one table lookup each, emitting moves inline. Queens are walked
+    # once as bishops and once as rooks; the two target sets never overlap.
+    occ = pos.occ
+    not_own = ~color_occ(pos, color) & evasion
+    queens = getattr(pos, color + 'Q')
+    for bb, attacks in ((getattr(pos, color + 'N'), None),
+                        (getattr(pos, color + 'B') | queens, bishop_attacks),
+                        (getattr(pos, color + 'R') | queens, rook_attacks)):
+        batch = []
+        while bb:
+            lsb = bb & -bb
+            sq = lsb.bit_length() - 1
+            bb ^= lsb
+            targets = (KNIGHT_ATTACKS[sq] if attacks is None else attacks(sq, occ)) & not_own
+            if sq in pins:
+                targets &= pins[sq]
+            while targets:
+                lsb = targets & -targets
+                to = lsb.bit_length() - 1
+                targets ^= lsb
+                batch.append(sq | (to << 6))
+        yield batch
+
+
+# Positions recur within a game, so legal move lists are kept in a small LRU
+# keyed by (Zobrist hash, color, underpromotions). Tuples keep cached results immutable.
+LEGAL_MOVES_CACHE_SIZE = 1024
+_legal_moves_lru: "OrderedDict[Tuple[int, str, bool], Tuple[Move, ...]]" = OrderedDict()
+
+
+def generate_legal_moves(pos: Position, color: str, include_underpromotions: bool = False) -> Tuple[Move, ...]:
+    key = (pos.hash, color, include_underpromotions)
+    moves = _legal_moves_lru.get(key)
+    if moves is not None:
+        _legal_moves_lru.move_to_end(key)
+        return moves
+    legal: List[Move] = []
+    for batch in legal_move_batches(pos, color, include_underpromotions):
+        legal.extend(batch)
+    moves = tuple(legal)
+    _legal_moves_lru[key] = moves
+    if len(_legal_moves_lru) > LEGAL_MOVES_CACHE_SIZE:
+        _legal_moves_lru.popitem(last=False)
+    return moves
 
-    return False
 
+def has_any_legal_moves(pos: Position, color: str) -> bool:
+    # Stops at the first piece with a legal move
+    return any(legal_move_batches(pos, color))
 
-def is_in_check(board: Board, color: str) -> bool:
-    kr, kc = find_king(board, color)
-    if kr == -1:
-        return False
-    opponent = 'b' if color == 'w' else 'w'
-    return square_attacked_by(board, kr, kc, opponent)
 
+# ---------------------------
+# Per-Position Caches
+# ---------------------------
+# run_game bumps a pos_version counter whenever the position changes, so
+# results keyed by (pos_version, color) stay valid until the next move.
+_check_cache: Dict[Tuple[int, str], bool] = {}
+# Single slot: (pos_version, color, moves, set of the same moves)
+_cached_legal: Tuple[int, str, Tuple[Move, ...], FrozenSet[Move]] = (-1, '', (), frozenset())
 
-def generate_legal_moves(board: Board, color: str) -> List[Move]:
-    legal: List[Move] = []
-    for move in generate_pseudo_legal(board, color):
-        newb = apply_move(board, move)
-        if not is_in_check(newb, color):
-            legal.append(move)
-    return legal
+
+def _version_cached(cache: Dict, pos: Position, version: int, color: str, compute: Callable):
+    key = (version, color)
+    if key not in cache:
+        # All entries share one version; drop them once the position moves on
+        if cache and next(iter(cache))[0] != version:
+            cache.clear()
+        cache[key] = compute(pos, color)
+    return cache[key]
+
+
+def cached_is_in_check(pos: Position, version: int, color: str) -> bool:
+    return _version_cached(_check_cache, pos, version, color, is_in_check)
+
+
+def get_legal_moves(pos: Position, version: int, color: str) -> Tuple[Tuple[Move, ...], FrozenSet[Move]]:
+    # Legal moves for the player, including underpromotions, plus a set for
+    # membership tests; reused until the version changes
+    global _cached_legal
+    if _cached_legal[0] != version or _cached_legal[1] != color:
+        moves = generate_legal_moves(pos, color, include_underpromotions=True)
+        _cached_legal = (version, color, moves, frozenset(moves))
+    return _cached_legal[2], _cached_legal[3]
 
 
 # ---------------------------
 # AI (Random Move)
 # ---------------------------
 
-def ai_select_move(board: Board, color: str) -> Optional[Move]:
-    moves = generate_legal_moves(board, color)
+def ai_select_move(pos: Position, color: str) -> Optional[Move]:
+    moves = generate_legal_moves(pos, color)
     if not moves:
         return None
-    # Slightly prefer captures by shuffling then sorting
-    random.shuffle(moves)
-    def capture_score(m: Move) -> int:
-        r1, c1, r2, c2, _ = m
-        target = board[r2][c2]
-        return 1 if target is not None else 0
-    moves.sort(key=capture_score, reverse=True)
-    return moves[0]
+    # Prefer a random capture; with none, every move is quiet
+    enemy = color_occ(pos, 'b' if color == 'w' else 'w')
+    captures = [m for m in moves if (enemy >> mv_to(m)) & 1]
+    return random.choice(captures or moves)
 
 
 # ---------------------------
 # Rendering
 # ---------------------------
 
-def draw_board(board: Board, selected: Optional[Tuple[int, int]], legal_moves_for_selected: List[Tuple[int, int]], turn: str, game_over_text: Optional[str]):
-    # Draw squares
+def render_checkerboard() -> pygame.Surface:
+    surf = pygame.Surface((WIDTH, HEIGHT)).convert()
     for r in range(ROWS):
         for c in range(COLS):
             color = LIGHT_SQ if (r + c) % 2 == 0 else DARK_SQ
-            pygame.draw.rect(screen, color, (c * SQUARE_SIZE, r * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+            pygame.draw.rect(surf, color, (c * SQUARE_SIZE, r * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+    return surf
+
+
+BOARD_SURFACE = render_checkerboard()
+MOVE_HIGHLIGHT_SURFACE = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
+MOVE_HIGHLIGHT_SURFACE.fill((*HIGHLIGHT_MOVE, 100))
+OVERLAY_SURFACE = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+OVERLAY_SURFACE.fill(OVERLAY_BG)
+ALL_SQUARES = set(range(ROWS * COLS))
+
+
+def square_rect(sq: int) -> pygame.Rect:
+    r, c = divmod(sq, COLS)
+    return pygame.Rect(c * SQUARE_SIZE, r * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+
+
+def promotion_picker(move: Move) -> List[Tuple[int, int]]:
+    # (square, promo) pairs, stacked from the promotion square toward the board center
+    to = mv_to(move)
+    step = COLS if to < COLS else -COLS
+    return [(to + i * step, promo) for i, promo in enumerate(PROMO_CHOICES)]
+
+
+def overlay_squares(pos: Position, pos_version: int, selected: Optional[int], legal_moves_for_selected: List[int], turn: str,
+                    promotion: Optional[Move] = None) -> Set[int]:
+    # Squares drawn with a highlight this frame; they need repainting when it goes away
+    marked = set(legal_moves_for_selected)
+    if promotion is not None:
+        marked.update(sq for sq, _ in promotion_picker(promotion))
+    if selected is not None:
+        marked.add(selected)
+    if cached_is_in_check(pos, pos_version, turn):
+        marked.add(find_king(pos, turn))
+    return marked
+
+
+def draw_board(pos: Position, pos_version: int, selected: Optional[int], legal_moves_for_selected: List[int], turn: str, game_over_text: Optional[str],
+               dirty: Optional[Set[int]] = None, promotion: Optional[Move] = None) -> List[pygame.Rect]:
+    # Repaint only the dirty squares (everything if None); returns the screen areas touched
+    if dirty is None or game_over_text:
+        dirty = ALL_SQUARES
+        screen.blit(BOARD_SURFACE, (0, 0))
+        touched = [screen.get_rect()]
+    else:
+        touched = []
+        for sq in dirty:
+            rect = square_rect(sq)
+            screen.blit(BOARD_SURFACE, rect, rect)
+            touched.append(rect)
 
     # Highlight legal moves for selected
-    for (rr, cc) in legal_moves_for_selected:
-        rect = pygame.Rect(cc * SQUARE_SIZE, rr * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-        s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-        s.fill((*HIGHLIGHT_MOVE, 100))
-        screen.blit(s, rect.topleft)
+    for sq in legal_moves_for_selected:
+        if sq not in dirty:
+            continue
+        screen.blit(MOVE_HIGHLIGHT_SURFACE, square_rect(sq))
 
     # Highlight selected square
-    if selected is not None:
-        sr, sc = selected
-        rect = pygame.Rect(sc * SQUARE_SIZE, sr * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-        pygame.draw.rect(screen, HIGHLIGHT_SELECT, rect, 4)
+    if selected is not None and selected in dirty:
+        pygame.draw.rect(screen, HIGHLIGHT_SELECT, square_rect(selected), 4)
 
     # Highlight check on current player's king
-    if is_in_check(board, turn):
-        kr, kc = find_king(board, turn)
-        rect = pygame.Rect(kc * SQUARE_SIZE, kr * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-        pygame.draw.rect(screen, HIGHLIGHT_CHECK, rect, 6)
+    if cached_is_in_check(pos, pos_version, turn):
+        ksq = find_king(pos, turn)
+        if ksq in dirty:
+            pygame.draw.rect(screen, HIGHLIGHT_CHECK, square_rect(ksq), 6)
 
     # Draw pieces
-    for r in range(ROWS):
-        for c in range(COLS):
-            p = board[r][c]
-            if not p:
+    for code in PIECE_CODES:
+        bb = getattr(pos, code)
+        while bb:
+            lsb = bb & -bb
+            sq = lsb.bit_length() - 1
+            bb ^= lsb
+            if sq not in dirty:
                 continue
-            center = (c * SQUARE_SIZE + SQUARE_SIZE // 2, r * SQUARE_SIZE + SQUARE_SIZE // 2)
-            draw_piece(p, center)
+            draw_piece(code, square_rect(sq).center)
+
+    # Promotion picker, covering the squares below (or above) the promotion square
+    if promotion is not None:
+        for sq, promo in promotion_picker(promotion):
+            if sq not in dirty:
+                continue
+            rect = square_rect(sq)
+            pygame.draw.rect(screen, PICKER_BG, rect)
+            pygame.draw.rect(screen, HIGHLIGHT_SELECT, rect, 2)
+            draw_piece(turn + PROMO_KINDS[promo], rect.center)
 
     # Game status overlay if game over
     if game_over_text:
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill(OVERLAY_BG)
-        screen.blit(overlay, (0, 0))
+        screen.blit(OVERLAY_SURFACE, (0, 0))
         text_surf = BIG_UI_FONT.render(game_over_text, True, (255, 255, 255))
         screen.blit(text_surf, text_surf.get_rect(center=(WIDTH // 2, HEIGHT // 2)))
+    return touched
 
 
-def draw_piece(piece: Piece, center: Tuple[int, int]):
-    glyph_map = UNICODE_WHITE if piece.color == 'w' else UNICODE_BLACK
-    glyph = glyph_map.get(piece.kind, '?')
-    try:
-        surf = PIECE_FONT.render(glyph, True, (0, 0, 0))
-        # Simple shadow
-        shadow = PIECE_FONT.render(glyph, True, (255, 255, 255))
-        rect = surf.get_rect(center=center)
-        srect = shadow.get_rect(center=(center[0] + 2, center[1] + 2))
-        screen.blit(shadow, srect)
-        screen.blit(surf, rect)
-    except Exception:
+def draw_piece(piece: str, center: Tuple[int, int]):
+    cached = PIECE_SURFACES.get(piece)
+    if cached:
+        surf, shadow = cached
+        screen.blit(shadow, shadow.get_rect(center=(center[0] + 2, center[1] + 2)))
+        screen.blit(surf, surf.get_rect(center=center))
+    else:
         # Fallback: draw simple shapes/letters
-        color = (20, 20, 20) if piece.color == 'b' else (240, 240, 240)
+        color, kind = piece
+        fill = (20, 20, 20) if color == 'b' else (240, 240, 240)
         radius = int(SQUARE_SIZE * 0.35)
-        pygame.draw.circle(screen, color, center, radius)
-        label = UI_FONT.render(piece.kind, True, (0, 0, 0) if piece.color == 'w' else (255, 255, 255))
+        pygame.draw.circle(screen, fill, center, radius)
+        label = UI_FONT.render(kind, True, (0, 0, 0) if color == 'w' else (255, 255, 255))
         screen.blit(label, label.get_rect(center=center))
 
 
@@ -400,16 +744,11 @@ def draw_piece(piece: Piece, center: Tuple[int, int]):
 # Game State and Loop
 # ---------------------------
 
-def has_any_legal_moves(board: Board, color: str) -> bool:
-    return len(generate_legal_moves(board, color)) > 0
-
-
-def game_status_text(board: Board, turn: str) -> Optional[str]:
+def game_status_text(pos: Position, turn: str, pos_version: int) -> Optional[str]:
     opponent = 'b' if turn == 'w' else 'w'
     # If it's the current turn's move and no legal moves
-    legal = generate_legal_moves(board, turn)
-    if not legal:
-        if is_in_check(board, turn):
+    if not has_any_legal_moves(pos, turn):
+        if cached_is_in_check(pos, pos_version, turn):
             # The side to move is checkmated; opponent wins
             return "Checkmate! " + ("White" if opponent == 'w' else "Black") + " wins"
         else:
@@ -418,12 +757,17 @@ def game_status_text(board: Board, turn: str) -> Optional[str]:
 
 
 def run_game():
-    board = initial_board()
+    pos = initial_board()
     turn = 'w'  # white moves first
-    selected: Optional[Tuple[int, int]] = None
-    legal_moves_cache: List[Move] = []
-    legal_squares_for_selected: List[Tuple[int, int]] = []
+    pos_version = 0  # bumped on every move; keys the per-position caches
+    selected: Optional[int] = None
+    legal_squares_for_selected: List[int] = []
+    promotion_pending: Optional[Move] = None  # promotion move awaiting the piece choice
     game_over_text: Optional[str] = None
+    # Dirty-rect bookkeeping: skip drawing when nothing visible changed
+    last_render_key = None
+    last_marked: Set[int] = set()
+    moved_squares: Set[int] = set()
 
     while True:
         clock.tick(60)
@@ -432,61 +776,77 @@ def run_game():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit(0)
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                # Window contents were lost; force a full repaint
+                last_render_key = None
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and game_over_text is None:
                 mx, my = event.pos
-                r, c = my // SQUARE_SIZE, mx // SQUARE_SIZE
+                sq = (my // SQUARE_SIZE) * COLS + mx // SQUARE_SIZE
                 if turn == 'w':
-                    if selected is None:
-                        # Select a white piece
-                        p = board[r][c]
-                        if p and p.color == 'w':
-                            selected = (r, c)
-                            legal_moves_cache = generate_legal_moves(board, 'w')
-                            legal_squares_for_selected = [(m[2], m[3]) for m in legal_moves_cache if m[0] == r and m[1] == c]
-                    else:
-                        sr, sc = selected
-                        # If clicking the same color piece, reselect
-                        p = board[r][c]
-                        if p and p.color == 'w' and (r, c) != (sr, sc):
-                            selected = (r, c)
-                            legal_moves_cache = generate_legal_moves(board, 'w')
-                            legal_squares_for_selected = [(m[2], m[3]) for m in legal_moves_cache if m[0] == r and m[1] == c]
+                    chosen: Optional[Move] = None
+                    if promotion_pending is not None:
+                        # Pick the promotion piece; clicking elsewhere cancels the move
+                        for picker_sq, promo in promotion_picker(promotion_pending):
+                            if sq == picker_sq:
+                                chosen = promotion_pending | (promo << 12)
+                        promotion_pending = None
+                        if chosen is None:
+                            selected = None
+                            legal_squares_for_selected = []
+                    # Select a white piece, or reselect when clicking another one
+                    elif (pos.white >> sq) & 1 and sq != selected:
+                        selected = sq
+                        legal_moves, _ = get_legal_moves(pos, pos_version, 'w')
+                        # A promotion lists its target square once per piece choice
+                        legal_squares_for_selected = list(dict.fromkeys(
+                            mv_to(m) for m in legal_moves if mv_from(m) == sq))
+                    elif selected is not None:
+                        # Attempt to move
+                        _, legal_set = get_legal_moves(pos, pos_version, 'w')
+                        if encode(selected, sq, PROMO_QUEEN) in legal_set:
+                            # Ask which piece to promote to before moving
+                            promotion_pending = encode(selected, sq)
+                        elif encode(selected, sq) in legal_set:
+                            chosen = encode(selected, sq)
                         else:
-                            # Attempt to move
-                            chosen: Optional[Move] = None
-                            for m in legal_moves_cache:
-                                if m[0] == sr and m[1] == sc and m[2] == r and m[3] == c:
-                                    chosen = m
-                                    break
-                            if chosen:
-                                board = apply_move(board, chosen)
-                                turn = 'b'
-                                selected = None
-                                legal_moves_cache = []
-                                legal_squares_for_selected = []
-                                # After white move, check if game ended
-                                game_over_text = game_status_text(board, turn)
-                            else:
-                                # Deselect if clicked elsewhere
-                                selected = None
-                                legal_moves_cache = []
-                                legal_squares_for_selected = []
+                            # Deselect if clicked elsewhere
+                            selected = None
+                            legal_squares_for_selected = []
+                    if chosen is not None:
+                        pos = apply_move(pos, chosen)
+                        pos_version += 1
+                        moved_squares.update((mv_from(chosen), mv_to(chosen)))
+                        turn = 'b'
+                        selected = None
+                        legal_squares_for_selected = []
+                        # After white move, check if game ended
+                        game_over_text = game_status_text(pos, turn, pos_version)
 
         # AI move if black to move and not game over
         if game_over_text is None and turn == 'b':
             # Simple delay could be added; for now, instant move
-            move = ai_select_move(board, 'b')
+            move = ai_select_move(pos, 'b')
             if move is None:
                 # No legal moves -> checkmate or stalemate from black's perspective
-                game_over_text = game_status_text(board, turn)
+                game_over_text = game_status_text(pos, turn, pos_version)
             else:
-                board = apply_move(board, move)
+                pos = apply_move(pos, move)
+                pos_version += 1
+                moved_squares.update((mv_from(move), mv_to(move)))
                 turn = 'w'
-                game_over_text = game_status_text(board, turn)
-
-        # Draw
-        draw_board(board, selected, legal_squares_for_selected, turn, game_over_text)
-        pygame.display.flip()
+                game_over_text = game_status_text(pos, turn, pos_version)
+
+        # Draw only when something visible changed, and only the affected squares
+        render_key = (pos_version, selected, promotion_pending, game_over_text)
+        if render_key != last_render_key:
+            marked = overlay_squares(pos, pos_version, selected, legal_squares_for_selected, turn, promotion_pending)
+            dirty = None if last_render_key is None else last_marked | marked | moved_squares
+            rects = draw_board(pos, pos_version, selected, legal_squares_for_selected, turn, game_over_text, dirty,
+                               promotion_pending)
+            pygame.display.update(rects)
+            last_render_key = render_key
+            last_marked = marked
+            moved_squares.clear()
 
 
 if __name__ == "__main__":